@@ -6,6 +6,7 @@ Import and use these functions in your API endpoints for database operations.
 """
 
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -17,6 +18,12 @@ load_dotenv()
 
 _client = None
 db = None
+_async_client = None
+async_db = None
+
+# Pool bounds for the async client serving API requests
+MAX_POOL_SIZE = 50
+MIN_POOL_SIZE = 5
 
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
@@ -24,13 +31,11 @@ database_name = os.getenv("DATABASE_NAME")
 if database_url and database_name:
     _client = MongoClient(database_url)
     db = _client[database_name]
+    _async_client = AsyncIOMotorClient(database_url, maxPoolSize=MAX_POOL_SIZE, minPoolSize=MIN_POOL_SIZE)
+    async_db = _async_client[database_name]
 
-# Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-
+def _prepare_document(data: Union[BaseModel, dict]) -> dict:
+    """Convert to a dict and stamp created_at/updated_at"""
     # Convert Pydantic model to dict if needed
     if isinstance(data, BaseModel):
         data_dict = data.model_dump()
@@ -39,17 +44,47 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
 
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
+    return data_dict
 
-    result = db[collection_name].insert_one(data_dict)
+def _apply_cursor_options(cursor, limit: int = None, batch_size: int = None, hint=None):
+    """Apply optional hint/limit/batch_size to a cursor"""
+    if hint:
+        cursor = cursor.hint(hint)
+    if limit:
+        cursor = cursor.limit(limit)
+    if batch_size:
+        cursor = cursor.batch_size(batch_size)
+    return cursor
+
+# Helper functions for common database operations
+def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with timestamp"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    result = db[collection_name].insert_one(_prepare_document(data))
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+def find_documents(collection_name: str, filter_dict: dict = None, limit: int = None,
+                   projection: dict = None, batch_size: int = None, hint=None):
+    """Get a lazy cursor over documents, optionally restricted to the projected fields"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
-    if limit:
-        cursor = cursor.limit(limit)
-    
-    return list(cursor)
+    cursor = db[collection_name].find(filter_dict or {}, projection=projection)
+    return _apply_cursor_options(cursor, limit, batch_size, hint)
+
+def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None,
+                  projection: dict = None, batch_size: int = None, hint=None):
+    """Get documents from collection"""
+    return list(find_documents(collection_name, filter_dict, limit, projection, batch_size, hint))
+
+# Async helpers for use from `async def` routes; they go through the Motor pool
+# and do not block the event loop.
+async def create_document_async(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with timestamp"""
+    if async_db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    result = await async_db[collection_name].insert_one(_prepare_document(data))
+    return str(result.inserted_id)
@@ -1,14 +1,24 @@
+import asyncio
+import logging
 import os
+import re
+from functools import lru_cache
+from operator import itemgetter
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+import msgspec
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import IndexModel, UpdateOne
 
-from database import db, create_document, get_documents
+from database import async_db, create_document_async
 from schemas import Property, Booking
 
-app = FastAPI(title="Huts-style API")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Huts-style API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,29 +29,193 @@ app.add_middleware(
 )
 
 
-class PropertyOut(BaseModel):
+class PropertyOut(msgspec.Struct):
     id: str
     title: str
     description: str
     location: str
     country: Optional[str] = None
-    price_per_night: float
-    max_guests: int
-    bedrooms: int
-    bathrooms: int
+    price_per_night: float = 0.0
+    max_guests: int = 1
+    bedrooms: int = 1
+    bathrooms: int = 1
     rating: Optional[float] = None
     review_count: Optional[int] = 0
     amenities: List[str] = []
     image_urls: List[str] = []
 
 
-@app.on_event("startup")
-async def seed_sample_properties():
-    if db is None:
-        return
+# Only the fields PropertyOut needs are fetched from MongoDB (_id is implicit).
+PROPERTY_PROJECTION = {
+    "title": 1,
+    "description": 1,
+    "location": 1,
+    "country": 1,
+    "price_per_night": 1,
+    "max_guests": 1,
+    "bedrooms": 1,
+    "bathrooms": 1,
+    "rating": 1,
+    "review_count": 1,
+    "amenities": 1,
+    "image_urls": 1,
+}
+PROPERTY_BATCH_SIZE = 200
+PRICE_INDEX_HINT = [("price_per_night", 1)]
+MAX_BATCH_IDS = 100
+DEFAULT_LIST_LIMIT = 100
+MAX_LIST_LIMIT = 1000
+
+# Defaults for fields a stored document may lack; merged under each document so
+# a single itemgetter call can pull every field in PropertyOut order.
+_PROPERTY_DEFAULTS = {
+    "title": "",
+    "description": "",
+    "location": "",
+    "country": None,
+    "price_per_night": 0,
+    "max_guests": 1,
+    "bedrooms": 1,
+    "bathrooms": 1,
+    "rating": None,
+    "review_count": 0,
+    "amenities": [],
+    "image_urls": [],
+}
+_property_fields = itemgetter(
+    "_id", "title", "description", "location", "country", "price_per_night", "max_guests",
+    "bedrooms", "bathrooms", "rating", "review_count", "amenities", "image_urls",
+)
+
+
+def property_from_doc(d: dict, _str=str, _float=float, _int=int, _PropertyOut=PropertyOut,
+                      _defaults=_PROPERTY_DEFAULTS, _fields=_property_fields) -> PropertyOut:
+    (_id, title, description, location, country, price, max_guests, bedrooms, bathrooms,
+     rating, review_count, amenities, image_urls) = _fields({**_defaults, **d})
+    return _PropertyOut(
+        _str(_id), title, description, location, country, _float(price), _int(max_guests),
+        _int(bedrooms), _int(bathrooms), rating, review_count, amenities, image_urls,
+    )
+
+
+# Response bodies are encoded with msgspec directly instead of going through
+# FastAPI's response_model / jsonable_encoder pipeline.
+_ENCODER = msgspec.json.Encoder()
+
+
+# Routes return pre-encoded bodies without response_model, so the OpenAPI docs
+# get the PropertyOut schema from msgspec instead. The struct has no nested
+# structs, so its component schema can be inlined.
+_PROPERTY_SCHEMA = msgspec.json.schema_components([PropertyOut])[1]["PropertyOut"]
+PROPERTY_RESPONSES = {200: {"content": {"application/json": {"schema": _PROPERTY_SCHEMA}}}}
+PROPERTY_LIST_RESPONSES = {
+    200: {"content": {"application/json": {"schema": {"type": "array", "items": _PROPERTY_SCHEMA}}}},
+}
+
+
+@lru_cache(maxsize=1024)
+def _to_oid(value: str) -> Optional[ObjectId]:
+    """Parse a property id, or None if it is not a valid ObjectId."""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _json_response(content, headers: Optional[dict] = None) -> Response:
+    return Response(content=_ENCODER.encode(content), media_type="application/json", headers=headers)
+
+
+# Property reads carry a weak ETag built from a per-process version counter
+# that create_property bumps. A matching If-None-Match gets a 304 without
+# touching MongoDB. The boot id keeps tags from another process or an
+# earlier run from matching.
+PROPERTY_CACHE_CONTROL = "public, max-age=30"
+_BOOT_ID = os.urandom(4).hex()
+app.state.property_version = 0
+
+
+def _property_etag(key: str) -> str:
+    return f'W/"{_BOOT_ID}-{app.state.property_version}-{key}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # "*" is not honored: it would turn lookups of missing properties into 304s.
+    return any(tag.strip() == etag for tag in header.split(","))
+
+
+def _cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": PROPERTY_CACHE_CONTROL}
+
+
+async def _iter_json(first: list, cursor, chunk_size: int = PROPERTY_BATCH_SIZE):
+    # Encodes a chunk of PropertyOut structs per msgspec call (msgspec already
+    # specializes the writer per Struct type) and emits one body chunk per
+    # cursor batch, so memory stays bounded without a send per document.
+    # `first` is the batch the route already fetched before sending headers.
+    encode = _ENCODER.encode
+    sep = b"["
+    if first:
+        yield sep + encode([property_from_doc(d) for d in first])[1:-1]
+        sep = b","
+    chunk = []
+    async for d in cursor:
+        chunk.append(property_from_doc(d))
+        if len(chunk) >= chunk_size:
+            yield sep + encode(chunk)[1:-1]
+            sep = b","
+            chunk = []
+    if chunk:
+        yield sep + encode(chunk)[1:-1]
+        sep = b","
+    yield b"[]" if sep == b"[" else b"]"
+
+
+async def ensure_property_indexes():
+    # Backs the `q` search; an unanchored case-insensitive $regex cannot use an index.
+    await async_db["property"].create_index(
+        [("title", "text"), ("description", "text"), ("location", "text")],
+        name="property_text",
+    )
+    await async_db["property"].create_indexes([
+        IndexModel([("location_lower", 1), ("price_per_night", 1)], name="location_lower_price"),
+        IndexModel([("price_per_night", 1)], name="price"),
+    ])
+
+
+# Marker document recording that every stored property has location_lower.
+# New documents always get it on insert, so the backfill only runs once.
+LOCATION_LOWER_MIGRATION = "property_location_lower"
+
+
+async def _backfill_location_lower() -> int:
+    # Lower-cases in Python, not with $toLower, so backfilled values match the
+    # str.lower() used by create_property and list_properties for non-ASCII text.
+    if await async_db["migrations"].find_one({"_id": LOCATION_LOWER_MIGRATION}) is not None:
+        return 0
+    modified = 0
+    ops = []
+    cursor = async_db["property"].find({"location_lower": {"$exists": False}}, projection={"location": 1})
+    async for d in cursor:
+        ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"location_lower": (d.get("location") or "").lower()}}))
+        if len(ops) >= PROPERTY_BATCH_SIZE:
+            modified += (await async_db["property"].bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        modified += (await async_db["property"].bulk_write(ops, ordered=False)).modified_count
+    await async_db["migrations"].update_one(
+        {"_id": LOCATION_LOWER_MIGRATION}, {"$currentDate": {"done_at": True}}, upsert=True,
+    )
+    return modified
+
+
+async def _seed_properties():
     try:
-        count = db["property"].count_documents({})
-        if count == 0:
+        # A single-_id probe answers "is it empty?" without counting the collection.
+        if await async_db["property"].find_one({}, projection={"_id": 1}) is None:
             samples = [
                 {
                     "title": "Cozy Mountain Hut",
@@ -95,10 +269,76 @@ async def seed_sample_properties():
                     ],
                 },
             ]
+            for sample in samples:
+                sample["location_lower"] = sample["location"].lower()
             if samples:
-                db["property"].insert_many(samples)
+                await async_db["property"].insert_many(samples, ordered=False, bypass_document_validation=True)
+                app.state.property_version += 1
+        # Backfill documents stored before location_lower existed. Location
+        # queries answered before it finished may be cached, so bump the version.
+        if await _backfill_location_lower() > 0:
+            app.state.property_version += 1
+        app.state.seeded = True
     except Exception:
-        pass
+        logger.exception("Seeding sample properties failed")
+    # Pick up the collections created by seeding without waiting for the next refresh.
+    await snapshot_collections()
+
+
+@app.on_event("startup")
+async def seed_sample_properties():
+    # Indexes are created before serving, since list_properties hints the price
+    # index and $text needs the text index. Seeding runs in the background and
+    # /ready reports 503 until it has succeeded.
+    app.state.seeded = async_db is None
+    if async_db is None:
+        return
+    try:
+        await ensure_property_indexes()
+    except Exception:
+        logger.exception("Creating property indexes failed")
+        return
+    app.state.seed_task = asyncio.create_task(_seed_properties())
+
+
+# /test is used as a health check, so it serves a snapshot of the collection
+# list instead of issuing listCollections on every hit.
+COLLECTIONS_REFRESH_SECONDS = 60
+
+
+async def snapshot_collections():
+    try:
+        app.state.collections = (await async_db.list_collection_names())[:10]
+        app.state.db_error = None
+    except Exception as e:
+        app.state.db_error = str(e)[:50]
+
+
+async def _refresh_collections():
+    while True:
+        await snapshot_collections()
+        await asyncio.sleep(COLLECTIONS_REFRESH_SECONDS)
+
+
+@app.on_event("startup")
+async def snapshot_database_info():
+    app.state.collections = []
+    app.state.db_error = None
+    app.state.db_name = async_db.name if async_db is not None else None
+    if async_db is None:
+        return
+    app.state.collections_task = asyncio.create_task(_refresh_collections())
+
+
+@app.on_event("shutdown")
+async def cancel_background_tasks():
+    tasks = [
+        task for task in (getattr(app.state, "collections_task", None), getattr(app.state, "seed_task", None))
+        if task is not None and not task.done()
+    ]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
 
 @app.get("/")
@@ -106,104 +346,129 @@ def root():
     return {"message": "Huts-style backend running"}
 
 
-@app.get("/api/properties", response_model=List[PropertyOut])
-def list_properties(q: Optional[str] = None, location: Optional[str] = None, min_price: Optional[float] = None, max_price: Optional[float] = None):
-    if db is None:
-        return []
+@app.get("/ready")
+def ready():
+    if not app.state.seeded:
+        return ORJSONResponse({"ready": False}, status_code=503)
+    return {"ready": True}
+
+
+@app.get("/api/properties", responses=PROPERTY_LIST_RESPONSES)
+async def list_properties(request: Request, q: Optional[str] = None, location: Optional[str] = None, min_price: Optional[float] = None, max_price: Optional[float] = None,
+                          limit: int = Query(DEFAULT_LIST_LIMIT, ge=1, le=MAX_LIST_LIMIT)):
+    if async_db is None:
+        return _json_response([])
+    etag = _property_etag(f"list-{hash((q, location, min_price, max_price, limit)) & 0xFFFFFFFFFFFFFFFF:x}")
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=_cache_headers(etag))
     filter_dict = {}
-    if q:
-        filter_dict["$or"] = [
-            {"title": {"$regex": q, "$options": "i"}},
-            {"description": {"$regex": q, "$options": "i"}},
-            {"location": {"$regex": q, "$options": "i"}},
-        ]
+    has_price = min_price is not None or max_price is not None
+    if has_price:
+        if max_price is None:
+            filter_dict["price_per_night"] = {"$gte": min_price}
+        elif min_price is None:
+            filter_dict["price_per_night"] = {"$lte": max_price}
+        else:
+            filter_dict["price_per_night"] = {"$gte": min_price, "$lte": max_price}
     if location:
-        filter_dict["location"] = {"$regex": location, "$options": "i"}
-    price_filter = {}
-    if min_price is not None:
-        price_filter["$gte"] = min_price
-    if max_price is not None:
-        price_filter["$lte"] = max_price
-    if price_filter:
-        filter_dict["price_per_night"] = price_filter
-
-    docs = get_documents("property", filter_dict)
-    results: List[PropertyOut] = []
-    for d in docs:
-        results.append(PropertyOut(
-            id=str(d.get("_id")),
-            title=d.get("title", ""),
-            description=d.get("description", ""),
-            location=d.get("location", ""),
-            country=d.get("country"),
-            price_per_night=float(d.get("price_per_night", 0)),
-            max_guests=int(d.get("max_guests", 1)),
-            bedrooms=int(d.get("bedrooms", 1)),
-            bathrooms=int(d.get("bathrooms", 1)),
-            rating=d.get("rating"),
-            review_count=d.get("review_count", 0),
-            amenities=d.get("amenities", []),
-            image_urls=d.get("image_urls", []),
-        ))
-    return results
-
-
-@app.post("/api/properties", status_code=201)
-def create_property(prop: Property):
-    inserted_id = create_document("property", prop)
-    return {"id": inserted_id}
-
-
-@app.get("/api/properties/{property_id}", response_model=PropertyOut)
-def get_property(property_id: str):
-    if db is None:
+        # Case-sensitive anchored prefix on the lower-cased copy, so the
+        # location_lower_price index bounds the scan.
+        filter_dict["location_lower"] = {"$regex": "^" + re.escape(location.lower())}
+    if q:
+        filter_dict["$text"] = {"$search": q}
+
+    # A single early $match, then only PropertyOut's fields, bounded by `limit`.
+    pipeline = [
+        {"$match": filter_dict},
+        {"$project": PROPERTY_PROJECTION},
+        {"$limit": limit},
+    ]
+    options = {"allowDiskUse": False, "batchSize": PROPERTY_BATCH_SIZE}
+    # The planner does not always pick the range index for a bare price filter.
+    # $text queries cannot take a hint, so only price-only queries get one.
+    if has_price and not q and not location:
+        options["hint"] = PRICE_INDEX_HINT
+    cursor = async_db["property"].aggregate(pipeline, **options)
+    # Fetch the first batch before any response is started, so query errors
+    # (bad hint, missing text index, invalid $text search) surface as a 500
+    # rather than a truncated 200. Results that fit in one batch skip streaming.
+    first = await cursor.to_list(length=PROPERTY_BATCH_SIZE)
+    if len(first) < PROPERTY_BATCH_SIZE:
+        return _json_response([property_from_doc(d) for d in first], headers=_cache_headers(etag))
+    return StreamingResponse(_iter_json(first, cursor), media_type="application/json", headers=_cache_headers(etag))
+
+
+# The POST handlers build their response directly so FastAPI skips
+# jsonable_encoder for these small bodies.
+@app.post("/api/properties", status_code=201, response_class=ORJSONResponse)
+async def create_property(prop: Property):
+    data = prop.model_dump()
+    data["location_lower"] = prop.location.lower()
+    inserted_id = await create_document_async("property", data)
+    app.state.property_version += 1
+    return ORJSONResponse({"id": inserted_id}, status_code=201)
+
+
+@app.get("/api/properties/{property_id}", responses=PROPERTY_RESPONSES)
+async def get_property(request: Request, property_id: str):
+    oid = _to_oid(property_id)
+    if async_db is None or oid is None:
         raise HTTPException(status_code=404, detail="Not found")
-    doc = db["property"].find_one({"_id": ObjectId(property_id)})
-    if not doc:
+    etag = _property_etag(str(oid))
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=_cache_headers(etag))
+    doc = await async_db["property"].find_one({"_id": oid}, projection=PROPERTY_PROJECTION)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Not found")
-    return PropertyOut(
-        id=str(doc.get("_id")),
-        title=doc.get("title", ""),
-        description=doc.get("description", ""),
-        location=doc.get("location", ""),
-        country=doc.get("country"),
-        price_per_night=float(doc.get("price_per_night", 0)),
-        max_guests=int(doc.get("max_guests", 1)),
-        bedrooms=int(doc.get("bedrooms", 1)),
-        bathrooms=int(doc.get("bathrooms", 1)),
-        rating=doc.get("rating"),
-        review_count=doc.get("review_count", 0),
-        amenities=doc.get("amenities", []),
-        image_urls=doc.get("image_urls", []),
-    )
+    return _json_response(property_from_doc(doc), headers=_cache_headers(etag))
+
+
+@app.post("/api/properties/batch", responses=PROPERTY_LIST_RESPONSES)
+async def get_properties_batch(ids: List[str]):
+    """Fetch several properties in one request; results follow the order of `ids`
+    and ids that are malformed or not found are left out."""
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    if async_db is None:
+        return _json_response([])
+    oids = [oid for oid in map(_to_oid, ids) if oid is not None]
+    by_id = {}
+    if oids:
+        cursor = async_db["property"].find({"_id": {"$in": oids}}, projection=PROPERTY_PROJECTION)
+        async for d in cursor:
+            by_id[d["_id"]] = property_from_doc(d)
+    return _json_response([by_id[oid] for oid in oids if oid in by_id])
 
 
-@app.post("/api/bookings", status_code=201)
-def create_booking(booking: Booking):
-    inserted_id = create_document("booking", booking)
-    return {"id": inserted_id, "status": "received"}
+@app.post("/api/bookings", status_code=201, response_class=ORJSONResponse)
+async def create_booking(booking: Booking):
+    inserted_id = await create_document_async("booking", booking)
+    return ORJSONResponse({"id": inserted_id, "status": "received"}, status_code=201)
+
+
+# Fixed parts of the /test response, resolved once at import.
+_TEST_RESPONSE_TEMPLATE = {
+    "backend": "✅ Running",
+    "database": "❌ Not Available",
+    "database_url": None,
+    "database_name": None,
+    "connection_status": "Not Connected",
+    "collections": []
+}
+_DATABASE_URL_STATUS = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
 
 
 @app.get("/test")
-def test_database():
-    response = {
-        "backend": "✅ Running",
-        "database": "❌ Not Available",
-        "database_url": None,
-        "database_name": None,
-        "connection_status": "Not Connected",
-        "collections": []
-    }
-    try:
-        from database import db as _db
-        if _db is not None:
-            response["database"] = "✅ Connected & Working"
-            response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-            response["database_name"] = _db.name
-            response["connection_status"] = "Connected"
-            response["collections"] = _db.list_collection_names()[:10]
-    except Exception as e:
-        response["database"] = f"❌ Error: {str(e)[:50]}"
+async def test_database():
+    response = _TEST_RESPONSE_TEMPLATE.copy()
+    if async_db is not None:
+        response["database"] = "✅ Connected & Working"
+        response["database_url"] = _DATABASE_URL_STATUS
+        response["database_name"] = app.state.db_name
+        response["connection_status"] = "Connected"
+        response["collections"] = app.state.collections
+        if app.state.db_error:
+            response["database"] = f"❌ Error: {app.state.db_error}"
     return response
 
 